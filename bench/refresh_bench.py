@@ -0,0 +1,73 @@
+"""仓位刷新耗时基准。
+
+用法：
+    python bench/refresh_bench.py                # 测当前代码
+    python bench/refresh_bench.py --tree <目录>  # 测另一份代码，例如用 git worktree 检出的旧版本
+
+在 offscreen 平台下建 5 个仓位、每个仓位 --specs 个规格，对所有仓位执行 update_display
+并处理完事件（含延迟删除），多次重复取中位数。
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import logging
+import warnings
+import statistics
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="仓位刷新耗时基准")
+    parser.add_argument("--tree", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="包含 warehouse_main.py 的目录")
+    parser.add_argument("--specs", type=int, default=400, help="每个仓位追加的规格数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.tree))
+    logging.getLogger("matplotlib").setLevel(logging.ERROR)
+    warnings.filterwarnings("ignore")
+
+    import warehouse_main
+    from PyQt6.QtCore import QEvent
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication([])
+    if hasattr(warehouse_main, "APP_STYLESHEET"):
+        app.setStyleSheet(warehouse_main.APP_STYLESHEET)
+
+    window = warehouse_main.MainWindow()
+    random.seed(0)
+    for _, boards in window.warehouse_data:
+        boards.extend(
+            (f"1.000×1.000×{i / 1000 + 0.001:.3f}", random.uniform(0, 4))
+            for i in range(args.specs)
+        )
+    window.load_warehouses()
+    window.show()
+    app.processEvents()
+
+    tiles = [window.grid.itemAt(i).widget() for i in range(window.grid.count())]
+    label_count = sum(len(tile.board_data) + 1 for tile in tiles)
+
+    def refresh():
+        for tile in tiles:
+            tile.update_display()
+        app.processEvents()
+        app.sendPostedEvents(None, QEvent.Type.DeferredDelete.value)
+
+    refresh()
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        refresh()
+        timings.append(time.perf_counter() - start)
+
+    print(f"{label_count} 个标签，刷新耗时中位数 {statistics.median(timings):.3f} 秒")
+
+
+if __name__ == "__main__":
+    main()
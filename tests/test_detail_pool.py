@@ -0,0 +1,69 @@
+import os
+import sys
+import resource
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+pytest.importorskip("PyQt6")
+pytest.importorskip("matplotlib")
+
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtTest import QTest
+from PyQt6.QtWidgets import QApplication
+
+import warehouse_main
+
+CYCLES = 1000
+WARMUP_CYCLES = 50
+MAX_RSS_GROWTH_KB = 10 * 1024
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def click_and_close(tile):
+    # 弹窗在 exec() 的事件循环里被自动关闭，与真实点击走同一条路径
+    QTimer.singleShot(0, lambda: QApplication.activeModalWidget().accept())
+    QTest.mouseClick(tile, Qt.MouseButton.LeftButton)
+
+
+def test_detail_dialogs_are_pooled_and_memory_stays_flat(app, monkeypatch):
+    window = warehouse_main.MainWindow()
+    window.show()
+    tiles = [window.grid.itemAt(i).widget() for i in range(window.grid.count())]
+    pool = window.detail_dialog_pool
+
+    for i in range(WARMUP_CYCLES):
+        click_and_close(tiles[i % len(tiles)])
+
+    opened = []
+    original_acquire = warehouse_main.DetailDialogPool.acquire
+    monkeypatch.setattr(
+        warehouse_main.DetailDialogPool, "acquire",
+        lambda self, *args: (opened.append(args[0]), original_acquire(self, *args))[1]
+    )
+    renders = []
+    original_render = warehouse_main.WarehouseDetailDialog.render_chart
+    monkeypatch.setattr(
+        warehouse_main.WarehouseDetailDialog, "render_chart",
+        lambda self: (renders.append(self.name), original_render(self))
+    )
+
+    rss_before = peak_rss_kb()
+    for i in range(CYCLES):
+        click_and_close(tiles[i % len(tiles)])
+        assert len(pool._idle) <= warehouse_main.DETAIL_POOL_SIZE
+
+    assert len(opened) == CYCLES
+    assert renders == []
+    assert peak_rss_kb() - rss_before < MAX_RSS_GROWTH_KB
+    window.close()
@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import random
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+pytest.importorskip("PyQt6")
+pytest.importorskip("matplotlib")
+
+import warehouse_main
+
+
+class MemoryTransport:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, batch):
+        self.sent.append(json.loads(json.dumps(batch)))
+
+
+def make_inventory(bays, specs, volume=1.0):
+    return [
+        (f"仓位{b}", [(f"1.000×1.000×{i / 1000 + 0.001:.3f}", volume) for i in range(specs)])
+        for b in range(bays)
+    ]
+
+
+def site_batches(site, epoch=1):
+    transport = MemoryTransport()
+    log = warehouse_main.ChangeLog(site, transport, make_inventory(2, 3, 2.0), epoch=epoch)
+    log.flush()
+    log.record("仓位0", "1.000×1.000×0.001", -0.5)
+    log.record("仓位1", "1.000×1.000×0.002", 1.25)
+    log.flush()
+    log.record("仓位0", "1.000×1.000×0.001", -0.25)
+    log.flush()
+    return transport.sent
+
+
+def test_shuffled_and_duplicated_batches_give_same_totals():
+    batches = site_batches("A") + site_batches("B")
+    in_order = warehouse_main.Consolidator()
+    for batch in batches:
+        assert in_order.apply(batch)
+
+    shuffled = batches * 2
+    random.Random(0).shuffle(shuffled)
+    consolidator = warehouse_main.Consolidator()
+    applied = sum(consolidator.apply(batch) for batch in shuffled)
+
+    assert applied == len(batches)
+    assert consolidator.totals() == pytest.approx(in_order.totals())
+    assert consolidator.totals()["1.000×1.000×0.001"] == pytest.approx(2 * (4.0 - 0.75))
+
+
+def test_newer_epoch_replaces_site_contribution():
+    consolidator = warehouse_main.Consolidator()
+    for batch in site_batches("A", epoch=1) + site_batches("B", epoch=1):
+        consolidator.apply(batch)
+
+    restart = MemoryTransport()
+    warehouse_main.ChangeLog("A", restart, [("仓位0", [("1.000×1.000×0.001", 1.0)])], epoch=2).flush()
+    consolidator.apply(restart.sent[0])
+    for batch in site_batches("A", epoch=1):
+        assert not consolidator.apply(batch)
+
+    assert consolidator.site_totals("A") == {("仓位0", "1.000×1.000×0.001"): 1.0}
+    assert consolidator.totals()["1.000×1.000×0.001"] == pytest.approx(1.0 + 2.0 + 2.0 - 0.75)
+
+
+def test_invalid_batch_leaves_state_untouched():
+    consolidator = warehouse_main.Consolidator()
+    first, *rest = site_batches("A")
+    consolidator.apply(first)
+    before = consolidator.totals()
+
+    for bad in (
+        dict(rest[0], deltas=rest[0]["deltas"] + [["仓位0", "1.000×1.000×0.001", "x"]]),
+        dict(rest[0], epoch=2, deltas=[["仓位0"]]),
+        dict(rest[0], seq=0),
+        [rest[0]],
+    ):
+        with pytest.raises(ValueError):
+            consolidator.apply(bad)
+        assert consolidator.totals() == before
+
+    # 修正后重发同一序号仍会生效
+    assert consolidator.apply(rest[0])
+
+
+def test_directory_transport_skips_undecodable_files(tmp_path):
+    transport = warehouse_main.DirectoryTransport(str(tmp_path))
+    warehouse_main.ChangeLog("A", transport, make_inventory(1, 2)).flush()
+    (tmp_path / "broken.json").write_text('{"site":', encoding="utf-8")
+
+    consolidator = warehouse_main.Consolidator()
+    assert consolidator.poll(transport) == 1
+    assert consolidator.poll(transport) == 0
+    assert sum(consolidator.totals().values()) == pytest.approx(2.0)
+
+
+def test_socket_round_trip_with_large_baseline():
+    inventory = make_inventory(5, 400)
+    baseline = [[bay, spec, volume] for bay, boards in inventory for spec, volume in boards]
+    assert len(json.dumps(baseline, ensure_ascii=False).encode("utf-8")) > 64 * 1024
+
+    consolidator = warehouse_main.Consolidator()
+    listener = warehouse_main.ReplicationListener(consolidator)
+    listener.start()
+    try:
+        log = warehouse_main.ChangeLog("A", warehouse_main.SocketTransport(listener.host, listener.port), inventory)
+        log.record("仓位0", "1.000×1.000×0.001", -0.5)
+        assert log.flush() > 1
+        assert log.outbox == []
+    finally:
+        listener.stop()
+
+    totals = consolidator.totals()
+    assert len(totals) == 400
+    assert totals["1.000×1.000×0.001"] == pytest.approx(4.5)
+    assert sum(totals.values()) == pytest.approx(2000 - 0.5)
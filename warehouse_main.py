@@ -1,4 +1,15 @@
+import os
 import sys
+import json
+import math
+import time
+import heapq
+import socket
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict
+from urllib.parse import quote, unquote, urlsplit
 import matplotlib
 
 matplotlib.use('QtAgg')
@@ -8,10 +19,13 @@ import matplotlib.pyplot as plt
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QLabel, QVBoxLayout, QLineEdit,
     QFormLayout, QMessageBox, QHBoxLayout, QGridLayout, QPushButton,
-    QScrollArea, QFrame, QDialog, QComboBox, QGroupBox, QCheckBox
+    QScrollArea, QFrame, QDialog, QComboBox, QGroupBox, QCheckBox,
+    QTableView, QAbstractItemView, QHeaderView, QStackedWidget
+)
+from PyQt6.QtGui import QDoubleValidator, QIntValidator, QFont, QColor
+from PyQt6.QtCore import (
+    Qt, QTimer, QAbstractTableModel, QSortFilterProxyModel, QModelIndex
 )
-from PyQt6.QtGui import QDoubleValidator, QIntValidator, QFont
-from PyQt6.QtCore import Qt
 
 # 添加字体配置
 matplotlib.rcParams["font.family"] = ["SimHei", "WenQuanYi Micro Hei", "Heiti TC", "Arial Unicode MS"]
@@ -20,6 +34,58 @@ matplotlib.rcParams["axes.unicode_minus"] = False  # 解决负号显示问题
 DEFAULT_THRESHOLD = 2.0
 WARNING_COLOR = "red"
 WARNING_TEXT = "⚠️ 低库存"
+DEFAULT_COVER_DAYS = 7.0  # 预计在该天数内用完的规格给出断货预警
+STOCKOUT_COLOR = "darkorange"
+STOCKOUT_TEXT = "⏳ 预计断货"
+CONSUMPTION_WINDOW_DAYS = 14.0  # 消耗速度指数加权的时间常数（天）
+QUERY_API_HOST = "127.0.0.1"  # 只读查询接口只监听本机
+QUERY_API_PORT = 8765
+QUERY_API_TIMEOUT = 10  # 读取请求头的超时（秒）
+QUERY_API_MAX_HEADERS = 100  # 请求头行数上限，单行长度受 AsyncServer.stream_limit 限制
+REPLICATION_INTERVAL_MS = 5000  # 站点变更集的发送间隔（毫秒）
+REPLICATION_TIMEOUT = 3  # 通过网络发送变更集的超时（秒）
+REPLICATION_MAX_DELTAS = 500  # 单个变更集最多携带的增量条数，基线过大时拆成多个序号
+REPLICATION_LINE_LIMIT = 1024 * 1024  # 变更集接收服务单行 JSON 的上限（字节）
+# 变更集接收服务默认只监听本机；该服务没有认证，对外开放需显式传入 host 并自行限制网络访问
+REPLICATION_HOST = "127.0.0.1"
+
+# 全局样式表：低库存等状态通过动态属性切换，刷新时无需逐个控件 setStyleSheet
+APP_STYLESHEET = f"""
+    WarehouseWidget, WarehouseWidget QLabel {{
+        border: 1px solid #888888;
+        border-radius: 10px;
+        padding: 10px;
+        margin: 6px;
+    }}
+    WarehouseWidget:hover {{
+        border-color: #555555;
+    }}
+    WarehouseWidget[lowStock="true"] {{
+        border-color: {WARNING_COLOR};
+        border-width: 2px;
+    }}
+    WarehouseWidget QLabel {{
+        border: none;
+    }}
+    QLabel[stockout="true"] {{
+        color: {STOCKOUT_COLOR};
+    }}
+    QLabel[lowStock="true"] {{
+        color: {WARNING_COLOR};
+    }}
+    WarehouseDetailDialog QLabel[lowStock="true"] {{
+        font-weight: bold;
+    }}
+"""
+DETAIL_POOL_SIZE = 2  # 空闲详情弹窗最多保留个数
+CHART_CACHE_SIZE = 16  # 图表图像缓存条目上限
+CHART_TOP_N = 20  # 规格图表最多单独显示的规格数，其余合并为“其他”
+THICKNESS_BIN_MM = 3.0  # 厚度分段宽度（毫米）
+MAX_THICKNESS_BINS = 12  # 厚度分段个数上限，超出时自动加宽分段
+OTHERS_LABEL = "其他"
+
+# 仓位数据版本号，全局递增，仓位数据每次变动都取新值
+DATA_VERSIONS = itertools.count(1)
 
 
 # 自定义图表画布
@@ -32,6 +98,54 @@ class MplCanvas(FigureCanvas):
         self.axes.spines['bottom'].set_visible(True)
         self.axes.spines['left'].set_visible(True)
         self.axes.spines['right'].set_visible(True)
+        self._pending_render = None
+
+    def bbox_size(self):
+        return tuple(int(v) for v in self.fig.bbox.size)
+
+    def snapshot(self):
+        return self.bbox_size(), self.copy_from_bbox(self.fig.bbox)
+
+    def restore_cached(self, cached, render):
+        # 直接贴回缓存的图像；真正需要重绘（如尺寸变化）时再调用 render 重建图形
+        if cached is None:
+            return False
+        size, region = cached
+        if size != self.bbox_size():
+            return False
+        self.restore_region(region)
+        self._pending_render = render
+        self.update()
+        return True
+
+    def draw(self):
+        render, self._pending_render = self._pending_render, None
+        if render is not None:
+            render()
+            return
+        super().draw()
+
+
+# 图表图像缓存（LRU）
+class ChartImageCache:
+    def __init__(self, max_entries=CHART_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        cached = self._entries.get(key)
+        if cached is not None:
+            self._entries.move_to_end(key)
+        return cached
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
 
 
 # 工具函数
@@ -42,24 +156,148 @@ def shorten_spec(spec):
     return spec
 
 
-def sort_by_thickness(data):
-    def get_thickness(spec):
-        parts = spec.split('×')
-        return float(parts[2]) * 100 if len(parts) == 3 else 0
+def set_style_flag(widget, name, value):
+    # 切换样式用的动态属性，只有值真正变化时才重新 polish
+    if widget.property(name) == value:
+        return False
+    widget.setProperty(name, value)
+    if widget.testAttribute(Qt.WidgetAttribute.WA_WState_Polished):
+        widget.style().unpolish(widget)
+        widget.style().polish(widget)
+    return True
+
+
+def sync_labels(layout, labels, count, make_label):
+    # 复用已有标签，只增删数量差额；新标签插在布局末尾的弹簧之前
+    while len(labels) > count:
+        label = labels.pop()
+        layout.removeWidget(label)
+        label.deleteLater()
+    while len(labels) < count:
+        label = make_label()
+        layout.insertWidget(layout.count() - 1, label)
+        labels.append(label)
+    return labels
+
+
+def get_thickness(spec):
+    # 厚度（毫米），无法解析的规格记为 0
+    parts = spec.split('×')
+    return round(float(parts[2]) * 1000, 3) if len(parts) == 3 else 0
+
 
+def sort_by_thickness(data):
     return sorted(data, key=lambda x: get_thickness(x[0]))
 
 
+def top_n_with_others(data, n=CHART_TOP_N, low_threshold=None):
+    # 取 n 个规格单独显示（按厚度排序），其余合并，返回 (前n项, 其余总量, 其余个数, 其余中的低库存个数)
+    # 给出 low_threshold 时低库存规格优先占位（储量越少越靠前），剩余名额按储量从大到小
+    def is_low(volume):
+        return low_threshold is not None and volume < low_threshold
+
+    data = list(data)
+    top = heapq.nsmallest(n, data, key=lambda x: (0, x[1]) if is_low(x[1]) else (1, -x[1]))
+    others_total = sum(vol for _, vol in data) - sum(vol for _, vol in top)
+    others_low = sum(is_low(vol) for _, vol in data) - sum(is_low(vol) for _, vol in top)
+    return sort_by_thickness(top), max(others_total, 0.0), len(data) - len(top), others_low
+
+
+def thickness_bin_layout(specs):
+    # 根据所有规格的厚度范围确定分段起点和宽度，保证分段数不超过上限
+    thicknesses = [get_thickness(spec) for spec in specs]
+    if not thicknesses:
+        return 0.0, THICKNESS_BIN_MM
+    width = THICKNESS_BIN_MM
+    start = (min(thicknesses) // width) * width
+    while (max(thicknesses) - start) // width >= MAX_THICKNESS_BINS:
+        width *= 2
+        start = (min(thicknesses) // width) * width
+    return start, width
+
+
+def thickness_bin_index(spec, start, width):
+    return int((get_thickness(spec) - start) // width)
+
+
+def thickness_bin_label(index, start, width):
+    lo = start + index * width
+    return f"{lo:g}-{lo + width:g}mm"
+
+
+def thickness_bins(data):
+    # 按厚度分段汇总，返回 [(分段标签, 总量, [(规格, 储量), ...]), ...]
+    data = list(data)
+    start, width = thickness_bin_layout(spec for spec, _ in data)
+    bins = {}
+    for spec, vol in data:
+        bins.setdefault(thickness_bin_index(spec, start, width), []).append((spec, vol))
+    return [
+        (thickness_bin_label(index, start, width), sum(vol for _, vol in items), sort_by_thickness(items))
+        for index, items in sorted(bins.items())
+    ]
+
+
+def warehouse_thickness_stacks(warehouse_data):
+    # 各仓位按厚度分段的储量，返回 (分段标签列表, [(仓位名, [各分段储量]), ...])
+    start, width = thickness_bin_layout(
+        spec for _, boards in warehouse_data for spec, _ in boards
+    )
+    indexes = sorted({
+        thickness_bin_index(spec, start, width)
+        for _, boards in warehouse_data for spec, _ in boards
+    })
+    position = {index: i for i, index in enumerate(indexes)}
+    stacks = []
+    for name, boards in warehouse_data:
+        totals = [0.0] * len(indexes)
+        for spec, vol in boards:
+            totals[position[thickness_bin_index(spec, start, width)]] += vol
+        stacks.append((name, totals))
+    return [thickness_bin_label(index, start, width) for index in indexes], stacks
+
+
+# 规格消耗速度跟踪：按时间指数加权，每次取用 O(1) 更新，不回溯历史
+class ConsumptionTracker:
+    def __init__(self, window_days=CONSUMPTION_WINDOW_DAYS, clock=time.time):
+        self.window_days = window_days
+        self.clock = clock
+        self._rates = {}  # 规格 -> (消耗速度 方/天, 上次更新时间)
+
+    def _decayed(self, rate, updated_at, now):
+        elapsed_days = max(now - updated_at, 0) / 86400
+        return rate * math.exp(-elapsed_days / self.window_days)
+
+    def record_take(self, spec, volume, now=None):
+        now = self.clock() if now is None else now
+        rate, updated_at = self._rates.get(spec, (0.0, now))
+        self._rates[spec] = (self._decayed(rate, updated_at, now) + volume / self.window_days, now)
+
+    def rate(self, spec, now=None):
+        if spec not in self._rates:
+            return 0.0
+        now = self.clock() if now is None else now
+        rate, updated_at = self._rates[spec]
+        return self._decayed(rate, updated_at, now)
+
+    def days_of_cover(self, spec, volume, now=None):
+        rate = self.rate(spec, now)
+        return volume / rate if rate > 0 else math.inf
+
+
 # 预警设置对话框
 class SettingsDialog(QDialog):
-    def __init__(self, current_threshold, current_enabled, parent=None):
+    def __init__(self, current_threshold, current_enabled, current_cover_days=DEFAULT_COVER_DAYS, parent=None):
         super().__init__(parent)
         self.setWindowTitle("库存预警设置")
         self.threshold = current_threshold
         self.enabled = current_enabled
+        self.cover_days = current_cover_days
 
         self.threshold_input = QLineEdit(str(current_threshold))
         self.threshold_input.setValidator(QDoubleValidator(0.001, 100.0, 3))
+        self.cover_days_input = QLineEdit(str(current_cover_days))
+        self.cover_days_input.setValidator(QDoubleValidator(0.1, 365.0, 1))
         self.enable_checkbox = QCheckBox("启用库存预警功能")
         self.enable_checkbox.setChecked(current_enabled)
 
@@ -70,6 +308,7 @@ class SettingsDialog(QDialog):
 
         form_layout = QFormLayout()
         form_layout.addRow("预警阈值（方）：", self.threshold_input)
+        form_layout.addRow("断货预警（天）：", self.cover_days_input)
         form_layout.addRow(self.enable_checkbox)
 
         btn_layout = QHBoxLayout()
@@ -84,6 +323,7 @@ class SettingsDialog(QDialog):
     def accept(self):
         try:
             self.threshold = float(self.threshold_input.text())
+            self.cover_days = float(self.cover_days_input.text())
             self.enabled = self.enable_checkbox.isChecked()
             super().accept()
         except ValueError:
@@ -293,34 +533,224 @@ class TakeDialog(QDialog):
             QMessageBox.warning(self, "错误", "请正确填写所有数值")
 
 
+# 库存列表模型，每行为 (规格, 储量, 是否低库存, 预计断货天数或 None)
+class StockListModel(QAbstractTableModel):
+    HEADERS = ["规格", "储量（方）", "状态"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._row_of = {}  # 规格 -> 行号
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def item(self, row):
+        return self._rows[row]
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        spec, volume, low, days = self._rows[index.row()]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return spec
+            if column == 1:
+                return f"{volume:.3f}"  # 三位小数
+            status = []
+            if low:
+                status.append(WARNING_TEXT)
+            if days is not None:
+                status.append(f"⏳ 约{days:.1f}天用完")
+            return " ".join(status)
+        if role == Qt.ItemDataRole.ForegroundRole:
+            if low:
+                return QColor(WARNING_COLOR)
+            if days is not None:
+                return QColor(STOCKOUT_COLOR)
+        if role == Qt.ItemDataRole.TextAlignmentRole and column == 1:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def set_items(self, items):
+        # 按规格比对新旧数据，只删除、更新、追加有变化的行
+        new_items = {item[0]: item for item in items}
+
+        for row in range(len(self._rows) - 1, -1, -1):
+            if self._rows[row][0] not in new_items:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self._rows[row]
+                self.endRemoveRows()
+        self._row_of = {item[0]: row for row, item in enumerate(self._rows)}
+
+        last_column = len(self.HEADERS) - 1
+        for row, old_item in enumerate(self._rows):
+            new_item = new_items[old_item[0]]
+            if new_item != old_item:
+                self._rows[row] = new_item
+                self.dataChanged.emit(self.index(row, 0), self.index(row, last_column))
+
+        added = [item for spec, item in new_items.items() if spec not in self._row_of]
+        if added:
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+            for item in added:
+                self._row_of[item[0]] = len(self._rows)
+                self._rows.append(item)
+            self.endInsertRows()
+
+
+# 库存列表的排序与筛选
+class StockFilterProxy(QSortFilterProxyModel):
+    SORT_KEYS = {
+        # 低库存按储量、预计断货按剩余天数、其余按储量
+        "worst": lambda item: (
+            (0, item[1], item[0]) if item[2]
+            else (1, item[3], item[0]) if item[3] is not None
+            else (2, item[1], item[0])
+        ),
+        "thickness": lambda item: (get_thickness(item[0]), item[0]),
+        "spec": lambda item: item[0],
+    }
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.sort_mode = "thickness"
+        self.warnings_only = False
+        self.text = ""
+        self.setDynamicSortFilter(True)
+
+    def set_sort_mode(self, mode):
+        self.sort_mode = mode
+        self.invalidate()
+        self.sort(0)
+
+    def set_warnings_only(self, warnings_only):
+        self.warnings_only = warnings_only
+        self.invalidateFilter()
+
+    def set_text(self, text):
+        self.text = text.strip()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        spec, _, low, days = self.sourceModel().item(source_row)
+        if self.warnings_only and not low and days is None:
+            return False
+        return self.text in spec
+
+    def lessThan(self, left, right):
+        sort_key = self.SORT_KEYS[self.sort_mode]
+        model = self.sourceModel()
+        return sort_key(model.item(left.row())) < sort_key(model.item(right.row()))
+
+
+# 库存列表面板：表格视图只绘制可见行，数据更新只触及变化的行
+class StockListPanel(QWidget):
+    def __init__(self, sort_mode="thickness", warnings_only=False, show_warnings_filter=True,
+                 empty_text="当前无低库存项目", parent=None):
+        super().__init__(parent)
+        self.model = StockListModel(self)
+        self.proxy = StockFilterProxy(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.warnings_only = warnings_only
+        self.proxy.sort_mode = sort_mode
+
+        self.sort_combo = QComboBox()
+        self.sort_combo.addItem("按厚度", "thickness")
+        self.sort_combo.addItem("最缺优先", "worst")
+        self.sort_combo.addItem("按规格", "spec")
+        self.sort_combo.setCurrentIndex(self.sort_combo.findData(sort_mode))
+        self.sort_combo.currentIndexChanged.connect(
+            lambda index: self.proxy.set_sort_mode(self.sort_combo.itemData(index))
+        )
+
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("筛选规格")
+        self.filter_input.textChanged.connect(self.on_filter_changed)
+
+        self.warnings_checkbox = QCheckBox("只看预警")
+        self.warnings_checkbox.setChecked(warnings_only)
+        self.warnings_checkbox.toggled.connect(self.on_warnings_only_changed)
+        self.warnings_checkbox.setVisible(show_warnings_filter)
+
+        self.view = QTableView()
+        self.view.setModel(self.proxy)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.view.verticalHeader().setVisible(False)
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.view.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+
+        self.empty_label = QLabel(empty_text)
+
+        # 空提示和表格放在同一位置切换，面板尺寸不随内容变化
+        self.stack = QStackedWidget()
+        self.stack.addWidget(self.empty_label)
+        self.stack.addWidget(self.view)
+
+        controls_layout = QHBoxLayout()
+        controls_layout.addWidget(self.sort_combo)
+        controls_layout.addWidget(self.filter_input)
+        controls_layout.addWidget(self.warnings_checkbox)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(controls_layout)
+        layout.addWidget(self.stack)
+
+        self.proxy.sort(0)
+        self.update_empty_state()
+
+    def on_filter_changed(self, text):
+        self.proxy.set_text(text)
+        self.update_empty_state()
+
+    def on_warnings_only_changed(self, checked):
+        self.proxy.set_warnings_only(checked)
+        self.update_empty_state()
+
+    def set_items(self, items):
+        self.model.set_items(items)
+        self.update_empty_state()
+
+    def update_empty_state(self):
+        self.stack.setCurrentWidget(self.empty_label if self.proxy.rowCount() == 0 else self.view)
+
+
 # 仓位详情弹窗
 class WarehouseDetailDialog(QDialog):
-    def __init__(self, name, board_data, warehouse_widget, parent=None):
+    def __init__(self, name, board_data, warehouse_widget, parent=None, chart_cache=None):
         super().__init__(parent)
-        self.name = name
-        self.board_data = board_data
-        self.warehouse_widget = warehouse_widget
         self.parent_window = parent
-        self.setWindowTitle(f"{name}-仓位详情")
+        self.chart_cache = chart_cache
         self.resize(900, 550)
 
-        self.warning_threshold = parent.warning_threshold if parent else DEFAULT_THRESHOLD
-        self.warning_enabled = parent.warning_enabled if parent else True
-
         main_layout = QVBoxLayout(self)
 
-        self.warning_group = QGroupBox(f"库存预警（低于 {self.warning_threshold} 方）")
+        self.warning_group = QGroupBox()
         self.warning_layout = QVBoxLayout()
+        self.warning_panel = StockListPanel(sort_mode="worst", warnings_only=True, show_warnings_filter=False)
+        self.warning_panel.setMaximumHeight(200)
+        self.warning_layout.addWidget(self.warning_panel)
         self.warning_group.setLayout(self.warning_layout)
         main_layout.addWidget(self.warning_group)
-        self.update_warning_visibility()
 
         data_chart_layout = QHBoxLayout()
 
         left_layout = QVBoxLayout()
-        title_label = QLabel(f"{name}的详细库存")
-        title_label.setFont(QFont("Arial", 13, weight=QFont.Weight.Bold))
-        left_layout.addWidget(title_label)
+        self.title_label = QLabel()
+        self.title_label.setFont(QFont("Arial", 13, weight=QFont.Weight.Bold))
+        left_layout.addWidget(self.title_label)
 
         line = QFrame()
         line.setFrameShape(QFrame.Shape.HLine)
@@ -330,6 +760,8 @@ class WarehouseDetailDialog(QDialog):
         self.scroll_area.setWidgetResizable(True)
         self.scroll_content = QWidget()
         self.scroll_layout = QVBoxLayout(self.scroll_content)
+        self.scroll_layout.addStretch()
+        self.data_labels = []
         self.scroll_area.setWidget(self.scroll_content)
         left_layout.addWidget(self.scroll_area)
 
@@ -341,7 +773,6 @@ class WarehouseDetailDialog(QDialog):
         right_layout.addWidget(chart_title)
 
         self.canvas = MplCanvas(width=5, height=3.5, dpi=100)
-        self.update_chart()
         right_layout.addWidget(self.canvas)
 
         data_chart_layout.addLayout(left_layout, stretch=1)
@@ -365,9 +796,44 @@ class WarehouseDetailDialog(QDialog):
         main_layout.addLayout(button_layout)
 
         self.setLayout(main_layout)
+        self.bind(name, board_data, warehouse_widget)
+
+    def bind(self, name, board_data, warehouse_widget):
+        # 复用同一个弹窗展示另一个仓位，只刷新数据相关的部分
+        self.name = name
+        self.board_data = board_data
+        self.warehouse_widget = warehouse_widget
+        self.setWindowTitle(f"{name}-仓位详情")
+        self.title_label.setText(f"{name}的详细库存")
+
+        parent = self.parent_window
+        self.warning_threshold = parent.warning_threshold if parent else DEFAULT_THRESHOLD
+        self.warning_enabled = parent.warning_enabled if parent else True
+        self.warning_group.setTitle(f"库存预警（低于 {self.warning_threshold} 方）")
+        self.update_warning_visibility()
+
+        self.update_chart()
         self.update_data_labels()
         self.update_warning_display()
 
+    def unbind(self):
+        # 放回池中前释放对仓位数据和组件的引用
+        self.board_data = []
+        self.warehouse_widget = None
+
+    def chart_cache_key(self):
+        if self.chart_cache is None or self.warehouse_widget is None:
+            return None
+        return (self.warehouse_widget.data_version, self.warning_threshold, self.warning_enabled)
+
+    def mark_data_changed(self):
+        if self.warehouse_widget:
+            self.warehouse_widget.mark_changed()
+
+    def record_movement(self, spec, delta):
+        if self.parent_window:
+            self.parent_window.record_movement(self.name, spec, delta)
+
     def update_warning_visibility(self):
         self.warning_group.setVisible(self.warning_enabled)
 
@@ -375,21 +841,25 @@ class WarehouseDetailDialog(QDialog):
         if not self.warning_enabled:
             return
 
-        while self.warning_layout.count():
-            item = self.warning_layout.takeAt(0)
-            if item.widget():
-                item.widget().deleteLater()
+        self.warning_panel.set_items([
+            (spec, vol, vol < self.warning_threshold, self.stockout_days(spec))
+            for spec, vol in self.board_data
+        ])
 
-        low_stock_items = [(spec, vol) for spec, vol in self.board_data
-                           if vol < self.warning_threshold]
-
-        if not low_stock_items:
-            self.warning_layout.addWidget(QLabel("当前无低库存项目"))
-        else:
-            for spec, vol in low_stock_items:
-                self.warning_layout.addWidget(QLabel(f"⚠️ {spec}: {vol:.3f}方（低于预警值）"))
+    def stockout_days(self, spec):
+        if not self.parent_window:
+            return None
+        return self.parent_window.stockout_days(spec)
 
     def update_chart(self):
+        key = self.chart_cache_key()
+        if key is not None and self.canvas.restore_cached(self.chart_cache.get(key), self.render_chart):
+            return
+        self.render_chart()
+        if key is not None:
+            self.chart_cache.put(key, self.canvas.snapshot())
+
+    def render_chart(self):
         self.canvas.axes.clear()
         self.canvas.axes.spines['top'].set_visible(False)
 
@@ -447,21 +917,16 @@ class WarehouseDetailDialog(QDialog):
         self.canvas.draw()
 
     def update_data_labels(self):
-        while self.scroll_layout.count():
-            item = self.scroll_layout.takeAt(0)
-            if item.widget():
-                item.widget().deleteLater()
-
         sorted_boards = sort_by_thickness(self.board_data)
-        for spec, volume in sorted_boards:
-            label = QLabel(f"规格：{spec}  数量：{volume:.3f}方")
-            if self.warning_enabled and volume < self.warning_threshold:
-                label.setStyleSheet(f"color: {WARNING_COLOR}; font-weight: bold;")
-            else:
-                label.setStyleSheet("border: none;")
-            self.scroll_layout.addWidget(label)
-
-        self.scroll_layout.addStretch()
+        sync_labels(self.scroll_layout, self.data_labels, len(sorted_boards), QLabel)
+        for label, (spec, volume) in zip(self.data_labels, sorted_boards):
+            text = f"规格：{spec}  数量：{volume:.3f}方"
+            days = self.stockout_days(spec)
+            if days is not None:
+                text += f"  {STOCKOUT_TEXT}：约{days:.1f}天"
+            label.setText(text)
+            set_style_flag(label, "lowStock", self.warning_enabled and volume < self.warning_threshold)
+            set_style_flag(label, "stockout", days is not None)
 
     def handle_store(self):
         try:
@@ -475,6 +940,8 @@ class WarehouseDetailDialog(QDialog):
                         break
                 if not found:
                     self.board_data.append((dialog.spec, dialog.volume))
+                self.mark_data_changed()
+                self.record_movement(dialog.spec, dialog.volume)
 
                 self.update_data_labels()
                 self.update_chart()
@@ -482,6 +949,7 @@ class WarehouseDetailDialog(QDialog):
                 if self.warehouse_widget:
                     self.warehouse_widget.update_display()
                 if self.parent_window:
+                    self.parent_window.refresh_spec_tiles(dialog.spec, self.warehouse_widget)
                     self.parent_window.update_total_stats()
         except Exception as e:
             QMessageBox.critical(self, "错误", f"存入操作失败: {str(e)}")
@@ -503,6 +971,8 @@ class WarehouseDetailDialog(QDialog):
                                 del self.board_data[i]
                             else:
                                 self.board_data[i] = (spec, new_volume)
+                            self.mark_data_changed()
+                            self.record_movement(spec, -dialog.volume)
                             break
                         else:
                             QMessageBox.warning(self, "错误", "库存不足，无法完成取用操作")
@@ -514,11 +984,35 @@ class WarehouseDetailDialog(QDialog):
             if self.warehouse_widget:
                 self.warehouse_widget.update_display()
             if self.parent_window:
+                self.parent_window.refresh_spec_tiles(dialog.spec, self.warehouse_widget)
                 self.parent_window.update_total_stats()
         except Exception as e:
             QMessageBox.critical(self, "错误", f"取用操作失败: {str(e)}")
 
 
+# 仓位详情弹窗池，复用弹窗及其图表画布
+class DetailDialogPool:
+    def __init__(self, parent, max_idle=DETAIL_POOL_SIZE):
+        self.parent = parent
+        self.max_idle = max_idle
+        self.chart_cache = ChartImageCache()
+        self._idle = []
+
+    def acquire(self, name, board_data, warehouse_widget):
+        if self._idle:
+            dialog = self._idle.pop()
+            dialog.bind(name, board_data, warehouse_widget)
+            return dialog
+        return WarehouseDetailDialog(name, board_data, warehouse_widget, self.parent, self.chart_cache)
+
+    def release(self, dialog):
+        dialog.unbind()
+        if len(self._idle) < self.max_idle:
+            self._idle.append(dialog)
+        else:
+            dialog.deleteLater()
+
+
 # 仓位模块组件
 class WarehouseWidget(QFrame):
     def __init__(self, name, board_data, parent=None):
@@ -526,26 +1020,15 @@ class WarehouseWidget(QFrame):
         self.name = name
         self.board_data = board_data
         self.parent_window = parent
+        self.data_version = next(DATA_VERSIONS)
         self.init_ui()
 
+    def mark_changed(self):
+        self.data_version = next(DATA_VERSIONS)
+
     def init_ui(self):
         self.setFrameShape(QFrame.Shape.StyledPanel)
         self.setFrameShadow(QFrame.Shadow.Raised)
-        self.setStyleSheet("""
-            QFrame {
-                border: 1px solid #888888;
-                border-radius: 10px;
-                padding: 10px;
-                margin: 6px;
-            }
-            QFrame:hover {
-                border-color: #555555;
-            }
-            QFrame#low_stock {
-                border-color: red;
-                border-width: 2px;
-            }
-        """)
         self.setMouseTracking(True)
         self.setAttribute(Qt.WidgetAttribute.WA_Hover, True)
 
@@ -555,55 +1038,65 @@ class WarehouseWidget(QFrame):
 
         self.name_label = QLabel(self.name)
         self.name_label.setFont(QFont("Arial", 14, weight=QFont.Weight.Bold))
-        self.name_label.setStyleSheet("border: none;")
         self.main_layout.addWidget(self.name_label)
+        self.main_layout.addStretch()
+        self.spec_labels = []
 
         self.update_display()
 
-    def update_display(self):
-        while self.main_layout.count() > 1:
-            item = self.main_layout.takeAt(1)
-            if item.widget():
-                item.widget().deleteLater()
+    def make_spec_label(self):
+        label = QLabel()
+        label.setFont(QFont("Arial", 10))
+        return label
 
+    def update_display(self):
         warning_enabled = self.parent_window.warning_enabled if self.parent_window else True
         warning_threshold = self.parent_window.warning_threshold if self.parent_window else DEFAULT_THRESHOLD
 
         has_low_stock = warning_enabled and any(
             vol < warning_threshold for _, vol in self.board_data
         )
+        stockout_days = {
+            spec: self.parent_window.stockout_days(spec)
+            for spec, _ in self.board_data
+        } if self.parent_window else {}
+        has_stockout = any(days is not None for days in stockout_days.values())
+
+        set_style_flag(self, "lowStock", has_low_stock)
+        set_style_flag(self.name_label, "lowStock", has_low_stock)
+        set_style_flag(self.name_label, "stockout", has_stockout)
 
+        name_text = self.name
         if has_low_stock:
-            self.setObjectName("low_stock")
-            self.name_label.setText(f"{self.name} {WARNING_TEXT}")
-            self.name_label.setStyleSheet("border: none; color: red;")
-        else:
-            self.setObjectName("")
-            self.name_label.setText(self.name)
-            self.name_label.setStyleSheet("border: none;")
+            name_text += f" {WARNING_TEXT}"
+        if has_stockout:
+            name_text += f" {STOCKOUT_TEXT}"
+        self.name_label.setText(name_text)
 
         sorted_boards = sort_by_thickness(self.board_data)
-        for spec, volume in sorted_boards:
-            label = QLabel(f"{spec}: {volume:.3f}方")  # 三位小数
-            label.setFont(QFont("Arial", 10))
-            if warning_enabled and volume < warning_threshold:
-                label.setStyleSheet(f"color: {WARNING_COLOR};")
-            else:
-                label.setStyleSheet("border: none;")
-            self.main_layout.addWidget(label)
-
-        self.main_layout.addStretch()
+        sync_labels(self.main_layout, self.spec_labels, len(sorted_boards), self.make_spec_label)
+        for label, (spec, volume) in zip(self.spec_labels, sorted_boards):
+            text = f"{spec}: {volume:.3f}方"  # 三位小数
+            days = stockout_days.get(spec)
+            if days is not None:
+                text += f"（约{days:.1f}天用完）"
+            label.setText(text)
+            set_style_flag(label, "lowStock", warning_enabled and volume < warning_threshold)
+            set_style_flag(label, "stockout", days is not None)
 
     def mousePressEvent(self, event):
         try:
             if event.button() == Qt.MouseButton.LeftButton:
-                dialog = WarehouseDetailDialog(
-                    self.name,
-                    self.board_data,
-                    self,
-                    self.parent_window
-                )
-                dialog.exec()
+                if self.parent_window:
+                    pool = self.parent_window.detail_dialog_pool
+                    dialog = pool.acquire(self.name, self.board_data, self)
+                    try:
+                        dialog.exec()
+                    finally:
+                        pool.release(dialog)
+                else:
+                    dialog = WarehouseDetailDialog(self.name, self.board_data, self)
+                    dialog.exec()
             super().mousePressEvent(event)
         except Exception as e:
             print(f"点击事件错误: {str(e)}")
@@ -614,19 +1107,111 @@ class StatsChartWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent_window = parent
+        self.data = {}
+        self.mode = "top_n"
+        self.drill_bin = None  # 厚度分段下钻时的分段标签
+        self._bin_bars = []
+        self._bin_labels = []
+
         self.layout = QVBoxLayout(self)
         self.layout.setContentsMargins(5, 5, 5, 5)
+
+        mode_layout = QHBoxLayout()
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItem(f"按规格（前{CHART_TOP_N}）", "top_n")
+        self.mode_combo.addItem("按厚度分段", "thickness")
+        self.mode_combo.addItem("按仓位堆叠", "warehouse")
+        self.mode_combo.currentIndexChanged.connect(self.on_mode_changed)
+        self.back_btn = QPushButton("返回分段")
+        self.back_btn.clicked.connect(self.leave_drill_down)
+        self.back_btn.setVisible(False)
+        mode_layout.addWidget(QLabel("图表模式："))
+        mode_layout.addWidget(self.mode_combo)
+        mode_layout.addWidget(self.back_btn)
+        mode_layout.addStretch()
+        self.layout.addLayout(mode_layout)
+
         self.canvas = MplCanvas(width=6, height=3, dpi=100)
+        self.canvas.mpl_connect('pick_event', self.on_pick)
         self.layout.addWidget(self.canvas)
 
+    def on_mode_changed(self, index):
+        self.mode = self.mode_combo.itemData(index)
+        self.drill_bin = None
+        self.redraw()
+
+    def on_pick(self, event):
+        if self.mode != "thickness" or self.drill_bin is not None:
+            return
+        if event.artist in self._bin_bars:
+            self.drill_bin = self._bin_labels[self._bin_bars.index(event.artist)]
+            self.redraw()
+
+    def leave_drill_down(self):
+        self.drill_bin = None
+        self.redraw()
+
     def update_chart(self, data):
+        self.data = data
+        self.redraw()
+
+    def redraw(self):
         self.canvas.axes.clear()
         self.canvas.axes.spines['top'].set_visible(False)
+        self._bin_bars = []
+        self._bin_labels = []
 
         warning_enabled = self.parent_window.warning_enabled if self.parent_window else True
         warning_threshold = self.parent_window.warning_threshold if self.parent_window else DEFAULT_THRESHOLD
 
-        sorted_items = sort_by_thickness(list(data.items()))
+        if self.mode == "thickness":
+            bins = thickness_bins(self.data.items())
+            drilled = [items for label, _, items in bins if label == self.drill_bin]
+            if drilled:
+                self.draw_specs(drilled[0], warning_enabled, warning_threshold,
+                                f'{self.drill_bin} 各规格总储量')
+            else:
+                self.drill_bin = None
+                self.draw_thickness_bins(bins, warning_enabled, warning_threshold)
+        elif self.mode == "warehouse":
+            warehouse_data = self.parent_window.warehouse_data if self.parent_window else []
+            self.draw_warehouse_stacks(warehouse_data)
+        else:
+            self.draw_specs(self.data.items(), warning_enabled, warning_threshold, '各规格板材总储量对比')
+
+        self.back_btn.setVisible(self.drill_bin is not None)
+        self.canvas.axes.tick_params(axis='both', labelsize=8)
+
+        # 调整底部边距，防止标签被截断
+        self.canvas.fig.subplots_adjust(bottom=0.45)
+        self.canvas.draw()
+
+    def annotate_bars(self, volumes):
+        # 修复1：数字精确到三位小数
+        for i, v in enumerate(volumes):
+            self.canvas.axes.text(
+                i, v + 0.1,
+                f'{v:.3f}',  # 改为三位小数
+                ha='center',
+                fontsize=8
+            )
+
+    def set_x_labels(self, labels):
+        x_pos = range(len(labels))
+        self.canvas.axes.set_xticks(x_pos)
+        self.canvas.axes.set_xticklabels(
+            labels,
+            rotation=30,
+            ha='right',
+            fontsize=7,
+            fontproperties = "SimHei"  # 强制指定字体
+        )
+
+    def draw_specs(self, items, warning_enabled, warning_threshold, title):
+        # 只单独画若干规格（低库存优先，其次储量最大），其余合并为一根“其他”柱，柱子数量有上限
+        sorted_items, others_total, others_count, others_low = top_n_with_others(
+            items, low_threshold=warning_threshold if warning_enabled else None
+        )
         specs = [shorten_spec(spec) for spec, _ in sorted_items]
         volumes = [volume for _, volume in sorted_items]
 
@@ -640,20 +1225,21 @@ class StatsChartWidget(QWidget):
             else:
                 colors.append(plt.cm.Set2.colors[0])
 
-        x_pos = range(len(specs))
-        self.canvas.axes.bar(x_pos, volumes, width=0.5, color=colors)
-        self.canvas.axes.set_xticks(x_pos)
-        self.canvas.axes.set_xticklabels(
-            specs,
-            rotation=30,
-            ha='right',
-            fontsize=7,
-            fontproperties = "SimHei"  # 强制指定字体
-        )
+        if others_count:
+            # 低库存规格多于柱子数量时，“其他”柱标红并注明其中的低库存个数
+            if others_low:
+                specs.append(f"{OTHERS_LABEL}（{others_count}种，{others_low}种低库存）")
+                colors.append('red')
+            else:
+                specs.append(f"{OTHERS_LABEL}（{others_count}种）")
+                colors.append('lightgray')
+            volumes.append(others_total)
+
+        self.canvas.axes.bar(range(len(specs)), volumes, width=0.5, color=colors)
+        self.set_x_labels(specs)
 
         self.canvas.axes.set_ylabel('总储量（方）', fontsize=9, fontweight='bold')
-        self.canvas.axes.set_title('各规格板材总储量对比', pad=10, fontsize=10)
-        self.canvas.axes.tick_params(axis='both', labelsize=8)
+        self.canvas.axes.set_title(title, pad=10, fontsize=10)
 
         if warning_enabled:
             self.canvas.axes.axhline(
@@ -665,29 +1251,546 @@ class StatsChartWidget(QWidget):
             )
             self.canvas.axes.legend(fontsize=7)
 
-        # 修复1：数字精确到三位小数
-        for i, v in enumerate(volumes):
-            self.canvas.axes.text(
-                i, v + 0.1,
-                f'{v:.3f}',  # 改为三位小数
-                ha='center',
-                fontsize=8
+        self.annotate_bars(volumes)
+
+    def draw_thickness_bins(self, bins, warning_enabled, warning_threshold):
+        labels = [label for label, _, _ in bins]
+        volumes = [total for _, total, _ in bins]
+
+        # 分段内有低库存规格时标红
+        colors = []
+        for _, _, items in bins:
+            if warning_enabled and any(vol < warning_threshold for _, vol in items):
+                colors.append('red')
+            else:
+                colors.append(plt.cm.Set2.colors[1])
+
+        bars = self.canvas.axes.bar(range(len(labels)), volumes, width=0.5, color=colors)
+        for bar in bars:
+            bar.set_picker(True)
+        self._bin_bars = list(bars)
+        self._bin_labels = labels
+        self.set_x_labels(labels)
+
+        self.canvas.axes.set_ylabel('总储量（方）', fontsize=9, fontweight='bold')
+        self.canvas.axes.set_title('各厚度分段总储量（点击柱子查看规格）', pad=10, fontsize=10)
+        self.annotate_bars(volumes)
+
+    def draw_warehouse_stacks(self, warehouse_data):
+        bin_labels, stacks = warehouse_thickness_stacks(warehouse_data)
+        names = [name for name, _ in stacks]
+        bottoms = [0.0] * len(stacks)
+
+        x_pos = range(len(names))
+        for i, label in enumerate(bin_labels):
+            heights = [totals[i] for _, totals in stacks]
+            self.canvas.axes.bar(
+                x_pos, heights, width=0.5, bottom=bottoms,
+                color=plt.cm.Set2.colors[i % len(plt.cm.Set2.colors)],
+                label=label
             )
+            bottoms = [b + h for b, h in zip(bottoms, heights)]
+        self.set_x_labels(names)
 
-        # 调整底部边距，防止标签被截断
-        self.canvas.fig.subplots_adjust(bottom=0.45)
-        self.canvas.draw()
+        self.canvas.axes.set_ylabel('总储量（方）', fontsize=9, fontweight='bold')
+        self.canvas.axes.set_title('各仓位储量（按厚度分段堆叠）', pad=10, fontsize=10)
+        if bin_labels:
+            self.canvas.axes.legend(fontsize=7)
+        self.annotate_bars(bottoms)
+
+
+# 只读库存快照，发布后不再修改，查询接口的所有响应都由它生成并缓存
+class InventorySnapshot:
+    # 进程启动标识，避免重启后版本号重复导致 ETag 误命中
+    SESSION = f"{int(time.time() * 1000):x}"
+
+    def __init__(self, version, warehouse_data, threshold, warning_enabled):
+        self.version = version
+        self.threshold = threshold
+        self.warning_enabled = warning_enabled
+        self.bays = tuple((name, tuple(boards)) for name, boards in warehouse_data)
+        self.etag = f'"{self.SESSION}-{version}"'
+        self._spec_totals = None
+        self._bodies = {}
+
+    def spec_totals(self):
+        if self._spec_totals is None:
+            totals = {}
+            for _, boards in self.bays:
+                for spec, volume in boards:
+                    totals[spec] = totals.get(spec, 0) + volume
+            self._spec_totals = tuple(sort_by_thickness(totals.items()))
+        return self._spec_totals
+
+    def is_low(self, volume):
+        return self.warning_enabled and volume < self.threshold
+
+    def bay_payload(self, name, boards):
+        return {
+            "name": name,
+            "total": round(sum(volume for _, volume in boards), 3),
+            "specs": [
+                {"spec": spec, "volume": round(volume, 3), "low_stock": self.is_low(volume)}
+                for spec, volume in sort_by_thickness(boards)
+            ],
+        }
+
+    def payload(self, path):
+        # 返回 None 表示资源不存在
+        if path == "/bays":
+            return [self.bay_payload(name, boards) for name, boards in self.bays]
+        if path.startswith("/bays/"):
+            name = unquote(path[len("/bays/"):])
+            for bay_name, boards in self.bays:
+                if bay_name == name:
+                    return self.bay_payload(bay_name, boards)
+            return None
+        if path == "/specs":
+            return [
+                {"spec": spec, "thickness_mm": get_thickness(spec), "total": round(total, 3),
+                 "low_stock": self.is_low(total)}
+                for spec, total in self.spec_totals()
+            ]
+        if path == "/low-stock":
+            return {
+                "enabled": self.warning_enabled,
+                "threshold": self.threshold,
+                "specs": [
+                    {"spec": spec, "total": round(total, 3)}
+                    for spec, total in self.spec_totals() if self.is_low(total)
+                ],
+                "bays": [
+                    {"bay": name, "spec": spec, "volume": round(volume, 3)}
+                    for name, boards in self.bays
+                    for spec, volume in sort_by_thickness(boards) if self.is_low(volume)
+                ],
+            }
+        if path == "/summary":
+            return {
+                "version": self.version,
+                "threshold": self.threshold,
+                "bay_count": len(self.bays),
+                "total": round(sum(total for _, total in self.spec_totals()), 3),
+                "specs": [
+                    {"spec": spec, "total": round(total, 3), "low_stock": self.is_low(total)}
+                    for spec, total in self.spec_totals()
+                ],
+            }
+        return None
+
+    def body(self, path):
+        if path not in self._bodies:
+            payload = self.payload(path)
+            if payload is None:
+                return None
+            self._bodies[path] = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        return self._bodies[path]
+
+
+# 在独立线程的 asyncio 事件循环中运行的 TCP 服务，不触碰界面线程
+# 子类需实现 async def _handle(self, reader, writer) 处理单个连接
+class AsyncServer:
+    stream_limit = 64 * 1024  # 单行读取上限（字节），超长时 readline 抛出 ValueError
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._writers = set()  # 当前连接，停止服务时一并关闭
+        self._ready = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._server is None:
+            raise OSError(f"无法监听 {self.host}:{self.port}")
+
+    def stop(self):
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._shutdown)
+            self._thread.join()
+
+    def _shutdown(self):
+        # wait_closed 会等待所有连接结束，所以要主动关闭仍保持着的连接
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+
+    async def _serve_client(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            await self._handle(reader, writer)
+        finally:
+            self._writers.discard(writer)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._serve_client, self.host, self.port, limit=self.stream_limit)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+        except OSError:
+            self._server = None
+            self._ready.set()
+            self._loop.close()
+            return
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(self._server.wait_closed())
+        finally:
+            self._loop.close()
+
+
+# 只读查询接口（HTTP/JSON）
+class QueryServer(AsyncServer):
+    REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 503: "Service Unavailable"}
+
+    def __init__(self, host=QUERY_API_HOST, port=QUERY_API_PORT):
+        super().__init__(host, port)
+        self.snapshot = None
+
+    def publish(self, snapshot):
+        # 由界面线程调用，整体替换引用即可，正在处理的请求继续使用旧快照
+        self.snapshot = snapshot
+
+    def respond(self, method, target, headers):
+        # 返回 (状态码, 响应头, 响应体)
+        if method not in ("GET", "HEAD"):
+            return 405, {"Allow": "GET, HEAD"}, b""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return 503, {}, b""
+        body = snapshot.body(urlsplit(target).path.rstrip("/") or "/")
+        if body is None:
+            return 404, {}, b""
+
+        response_headers = {
+            "ETag": snapshot.etag,
+            "Cache-Control": "no-cache",
+            "Content-Type": "application/json; charset=utf-8",
+        }
+        if_none_match = headers.get("if-none-match", "")
+        if if_none_match.strip() == "*" or snapshot.etag in [t.strip() for t in if_none_match.split(",")]:
+            return 304, response_headers, b""
+        return 200, response_headers, body
+
+    async def _read_request(self, reader):
+        # 返回 (方法, 目标, 请求头)；请求行或请求头过长、请求头过多、请求行格式错误时抛出 ValueError
+        request_line = await asyncio.wait_for(reader.readline(), QUERY_API_TIMEOUT)
+        headers = {}
+        for _ in range(QUERY_API_MAX_HEADERS + 1):
+            line = await asyncio.wait_for(reader.readline(), QUERY_API_TIMEOUT)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        else:
+            raise ValueError("请求头过多")
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise ValueError("无效的请求行")
+        method, target, _ = parts
+        return method, target, headers
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                method, target, headers = await self._read_request(reader)
+            except ValueError:
+                method = "GET"
+                status, response_headers, body = 400, {}, b""
+            else:
+                status, response_headers, body = self.respond(method, target, headers)
+
+            head = [f"HTTP/1.1 {status} {self.REASONS[status]}"]
+            head += [f"{key}: {value}" for key, value in response_headers.items()]
+            head += [f"Content-Length: {len(body)}", "Connection: close", "", ""]
+            writer.write("\r\n".join(head).encode("latin-1"))
+            if method != "HEAD":
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, UnicodeError):
+            pass
+        finally:
+            writer.close()
+
+
+# 站点变更记录：把存入/取用合并成按 (仓位, 规格) 累计的增量，按序号打包发送
+class ChangeLog:
+    def __init__(self, site_id, transport, warehouse_data=(), epoch=None):
+        self.site_id = site_id
+        self.transport = transport
+        # 本次运行的纪元，汇总端看到更新的纪元时会丢弃该站点旧纪元的数据
+        self.epoch = epoch if epoch is not None else int(time.time() * 1000)
+        self.seq = 0
+        self.outbox = []  # 已打包但尚未发送成功的变更集
+        self._pending = {}
+        self._lock = threading.Lock()  # 保护 outbox，发送可能在后台线程进行
+        self._send_lock = threading.Lock()  # 同一时间只有一个线程发送 outbox
+        self._sending = False
+
+        # 第一个变更集携带当前全部库存作为基线
+        for name, boards in warehouse_data:
+            for spec, volume in boards:
+                self.record(name, spec, volume)
+
+    def record(self, bay, spec, delta):
+        key = (bay, spec)
+        self._pending[key] = self._pending.get(key, 0.0) + delta
+
+    def pack(self):
+        # 把未打包的增量合成变更集放入 outbox，与 record 在同一线程调用
+        # 每个变更集最多 REPLICATION_MAX_DELTAS 条增量，较大的基线会占用多个连续序号
+        deltas = [
+            [bay, spec, round(delta, 6)]
+            for (bay, spec), delta in self._pending.items() if abs(delta) > 1e-9
+        ]
+        self._pending = {}
+        batches = []
+        for start in range(0, len(deltas), REPLICATION_MAX_DELTAS):
+            self.seq += 1
+            batches.append({"site": self.site_id, "epoch": self.epoch, "seq": self.seq,
+                            "deltas": deltas[start:start + REPLICATION_MAX_DELTAS]})
+        with self._lock:
+            self.outbox.extend(batches)
+
+    def send_outbox(self):
+        # 按序发送 outbox，网络失败的变更集留到下次重试，返回本次发送成功的个数
+        # 后台发送尚未结束时会先等待它完成
+        sent = 0
+        with self._send_lock:
+            while True:
+                with self._lock:
+                    if not self.outbox:
+                        break
+                    batch = self.outbox[0]
+                try:
+                    self.transport.send(batch)
+                except OSError:
+                    break
+                with self._lock:
+                    self.outbox.pop(0)
+                sent += 1
+        return sent
+
+    def flush(self):
+        self.pack()
+        return self.send_outbox()
+
+    def flush_in_background(self):
+        # 供界面线程的定时器调用：只在当前线程打包，发送放到后台线程，网络阻塞不会卡住界面
+        self.pack()
+        with self._lock:
+            if self._sending or not self.outbox:
+                return
+            self._sending = True
+        threading.Thread(target=self._send_in_background, name="replication-send", daemon=True).start()
+
+    def _send_in_background(self):
+        try:
+            self.send_outbox()
+        finally:
+            with self._lock:
+                self._sending = False
+
+
+# 汇总端：增量合并各站点变更集，乱序和重复的变更集都只生效一次
+class Consolidator:
+    def __init__(self):
+        self._sites = {}  # 站点 -> {"epoch", "applied_through", "applied", "totals"}
+        self._totals = {}  # 规格 -> 全部站点总储量
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def validate(batch):
+        # 整个变更集校验通过后才会生效，返回 (站点, 纪元, 序号, 增量列表)，格式错误抛出 ValueError
+        if not isinstance(batch, dict):
+            raise ValueError("变更集必须是 JSON 对象")
+        site, epoch, seq, deltas = (batch.get(key) for key in ("site", "epoch", "seq", "deltas"))
+        if not isinstance(site, str) or not site:
+            raise ValueError("变更集缺少站点标识")
+        for name, value in (("epoch", epoch), ("seq", seq)):
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                raise ValueError(f"变更集的 {name} 必须是正整数")
+        if not isinstance(deltas, list):
+            raise ValueError("变更集的 deltas 必须是列表")
+        checked = []
+        for delta in deltas:
+            if not isinstance(delta, list) or len(delta) != 3:
+                raise ValueError(f"无效的增量: {delta!r}")
+            bay, spec, volume = delta
+            if (not isinstance(bay, str) or not isinstance(spec, str)
+                    or isinstance(volume, bool) or not isinstance(volume, (int, float))
+                    or not math.isfinite(volume)):
+                raise ValueError(f"无效的增量: {delta!r}")
+            checked.append((bay, spec, float(volume)))
+        return site, epoch, seq, checked
+
+    def apply(self, batch):
+        site, epoch, seq, deltas = self.validate(batch)
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None or epoch > state["epoch"]:
+                if state is not None:
+                    self._retract(state)
+                state = {"epoch": epoch, "applied_through": 0, "applied": set(), "totals": {}}
+                self._sites[site] = state
+            elif epoch < state["epoch"]:
+                return False
+
+            if seq <= state["applied_through"] or seq in state["applied"]:
+                return False
+            state["applied"].add(seq)
+            while state["applied_through"] + 1 in state["applied"]:
+                state["applied_through"] += 1
+                state["applied"].remove(state["applied_through"])
+
+            for bay, spec, delta in deltas:
+                self._add(state["totals"], (bay, spec), delta)
+                self._add(self._totals, spec, delta)
+            return True
+
+    def _retract(self, state):
+        for (_, spec), volume in state["totals"].items():
+            self._add(self._totals, spec, -volume)
+
+    @staticmethod
+    def _add(totals, key, delta):
+        value = totals.get(key, 0.0) + delta
+        if abs(value) > 1e-9:
+            totals[key] = value
+        else:
+            totals.pop(key, None)
+
+    def poll(self, transport):
+        applied = 0
+        for batch in transport.receive():
+            try:
+                applied += self.apply(batch)
+            except ValueError as e:
+                print(f"忽略无效变更集: {str(e)}")
+        return applied
+
+    def totals(self):
+        with self._lock:
+            return dict(self._totals)
+
+    def site_totals(self, site):
+        with self._lock:
+            state = self._sites.get(site)
+            return dict(state["totals"]) if state else {}
+
+
+# 用共享目录传输变更集，每个变更集一个文件
+class DirectoryTransport:
+    def __init__(self, path):
+        self.path = path
+        self._seen = set()
+        os.makedirs(path, exist_ok=True)
+
+    def send(self, batch):
+        name = f"{quote(batch['site'], safe='')}.{batch['epoch']}.{batch['seq']:08d}.json"
+        tmp_path = os.path.join(self.path, f".{name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(batch, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def receive(self):
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".json") or name in self._seen:
+                continue
+            try:
+                with open(os.path.join(self.path, name), encoding="utf-8") as f:
+                    batch = json.load(f)
+            except OSError as e:
+                # 暂时读不到的文件留到下次再读
+                print(f"读取变更集文件失败 {name}: {str(e)}")
+                continue
+            except ValueError as e:
+                # 截断或不是变更集的文件：报告后跳过，不再重复读取
+                print(f"忽略无法解析的变更集文件 {name}: {str(e)}")
+                self._seen.add(name)
+                continue
+            self._seen.add(name)
+            yield batch
+
+
+# 通过 TCP 发送变更集，每行一个 JSON，对端确认后才算发送成功
+class SocketTransport:
+    def __init__(self, host, port, timeout=REPLICATION_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def send(self, batch):
+        line = json.dumps(batch, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with socket.create_connection((self.host, self.port), self.timeout) as sock:
+            sock.sendall(line.encode("utf-8"))
+            with sock.makefile("rb") as reply:
+                if reply.readline().strip() != b"ok":
+                    raise OSError("汇总端未确认变更集")
+
+
+# 汇总端的 TCP 接收服务，配合 SocketTransport 使用
+class ReplicationListener(AsyncServer):
+    stream_limit = REPLICATION_LINE_LIMIT
+
+    def __init__(self, consolidator, host=REPLICATION_HOST, port=0):
+        super().__init__(host, port)
+        self.consolidator = consolidator
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # 单行超过 stream_limit，之后的数据无法可靠分行，回复错误后关闭连接
+                    writer.write(f"error 变更集超过 {self.stream_limit} 字节\n".encode("utf-8"))
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                # 无效的变更集回复错误原因，连接保持可用
+                try:
+                    self.consolidator.apply(json.loads(line))
+                    reply = "ok"
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = f"error {str(e)}"
+                writer.write((reply.replace("\n", " ") + "\n").encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def format_totals(total_stats):
+    return "".join(f"  {spec}: {total:.3f} 方\n" for spec, total in sort_by_thickness(total_stats.items()))
 
 
 # 主窗口
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, query_server=None):
         super().__init__()
         self.setWindowTitle("仓位管理系统")
         self.resize(1200, 750)
 
         self.warning_threshold = DEFAULT_THRESHOLD
         self.warning_enabled = True
+        self.stockout_warning_days = DEFAULT_COVER_DAYS
+        self.consumption = ConsumptionTracker()
+        self.query_server = query_server
+        self.snapshot_versions = itertools.count(1)
+        self.change_log = None
+        self._spec_totals = None  # 各规格全场总储量缓存，库存变动时失效
+        self.detail_dialog_pool = DetailDialogPool(self)
 
         self.warehouse_data = [
             ("仓位 A", [("1.220×2.440×0.018", 3.216), ("1.830×0.915×0.009", 1.235)]),
@@ -724,17 +1827,11 @@ class MainWindow(QMainWindow):
 
         stats_layout = QHBoxLayout()
 
-        self.total_label = QLabel("总统计：")
-        self.total_label.setFont(QFont("Arial", 11))
-        self.total_label.setStyleSheet("""
-            QLabel {
-                border: 1px solid #888888;
-                border-radius: 5px;
-                padding: 8px;
-                margin: 10px;
-            }
-        """)
-        stats_layout.addWidget(self.total_label, stretch=1)
+        total_group = QGroupBox("总统计")
+        total_layout = QVBoxLayout(total_group)
+        self.total_panel = StockListPanel(sort_mode="thickness", empty_text="暂无库存")
+        total_layout.addWidget(self.total_panel)
+        stats_layout.addWidget(total_group, stretch=1)
 
         self.stats_chart = StatsChartWidget(self)
         stats_layout.addWidget(self.stats_chart, stretch=4)
@@ -745,6 +1842,22 @@ class MainWindow(QMainWindow):
         self.update_total_stats()
         self.setCentralWidget(main_widget)
 
+    def enable_replication(self, site_id, transport):
+        # 以当前库存为基线开始记录变更，并定时发送变更集
+        self.change_log = ChangeLog(site_id, transport, self.warehouse_data)
+        self.replication_timer = QTimer(self)
+        self.replication_timer.timeout.connect(self.change_log.flush_in_background)
+        self.replication_timer.start(REPLICATION_INTERVAL_MS)
+
+    def closeEvent(self, event):
+        # 退出前同步发送剩余变更集，最后一个发送间隔内的变动和之前发送失败的变更集都不会丢失
+        if self.change_log:
+            self.replication_timer.stop()
+            self.change_log.flush()
+            if self.change_log.outbox:
+                print(f"仍有 {len(self.change_log.outbox)} 个变更集未能发送到汇总端")
+        super().closeEvent(event)
+
     def load_warehouses(self):
         while self.grid.count():
             item = self.grid.takeAt(0)
@@ -760,13 +1873,16 @@ class MainWindow(QMainWindow):
         if dialog.exec() == QDialog.DialogCode.Accepted and dialog.warehouse_name:
             self.warehouse_data.append((dialog.warehouse_name, []))
             self.load_warehouses()
+            # 仓位集合变化后刷新统计、图表（按仓位堆叠模式）和查询快照
+            self.update_total_stats()
             QMessageBox.information(self, "成功", f"已添加新仓位：{dialog.warehouse_name}")
 
     def open_settings(self):
-        dialog = SettingsDialog(self.warning_threshold, self.warning_enabled, self)
+        dialog = SettingsDialog(self.warning_threshold, self.warning_enabled, self.stockout_warning_days, self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             self.warning_threshold = dialog.threshold
             self.warning_enabled = dialog.enabled
+            self.stockout_warning_days = dialog.cover_days
             self.refresh_all_displays()
 
     def refresh_all_displays(self):
@@ -777,35 +1893,83 @@ class MainWindow(QMainWindow):
 
         self.update_total_stats()
 
-    def update_total_stats(self):
-        total_stats = {}
+    def record_movement(self, bay, spec, delta):
+        # 存入为正、取用为负
+        self._spec_totals = None
+        if delta < 0:
+            self.consumption.record_take(spec, -delta)
+        if self.change_log:
+            self.change_log.record(bay, spec, delta)
+
+    def spec_totals(self):
+        if self._spec_totals is None:
+            total_stats = {}
+            for name, boards in self.warehouse_data:
+                for spec, volume in boards:
+                    total_stats[spec] = total_stats.get(spec, 0) + volume
+            self._spec_totals = total_stats
+        return self._spec_totals
+
+    def stockout_days(self, spec):
+        # 按该规格全场总储量和消耗速度估算，预计在预警天数内用完时返回剩余天数，否则返回 None
+        if not self.warning_enabled:
+            return None
+        days = self.consumption.days_of_cover(spec, self.spec_totals().get(spec, 0))
+        return days if days < self.stockout_warning_days else None
 
-        for name, boards in self.warehouse_data:
-            for spec, volume in boards:
-                total_stats[spec] = total_stats.get(spec, 0) + volume
+    def refresh_spec_tiles(self, spec, skip=None):
+        # 规格的总储量或消耗速度变化后，所有存放该规格的仓位的断货标记都要刷新
+        for i in range(self.grid.count()):
+            item = self.grid.itemAt(i)
+            widget = item.widget() if item else None
+            if widget and widget is not skip and any(s == spec for s, _ in widget.board_data):
+                widget.update_display()
 
-        sorted_total = sort_by_thickness(list(total_stats.items()))
-        total_text = "总统计（按厚度排序）：\n"
-        for spec, total in sorted_total:
-            if self.warning_enabled and total < self.warning_threshold:
-                total_text += f"  {spec}: {total:.3f} 方（低库存）\n"  # 三位小数
-            else:
-                total_text += f"  {spec}: {total:.3f} 方\n"  # 三位小数
-        self.total_label.setText(total_text)
+    def update_total_stats(self):
+        self._spec_totals = None
+        total_stats = dict(self.spec_totals())
+
+        self.total_panel.set_items([
+            (spec, total, self.warning_enabled and total < self.warning_threshold, self.stockout_days(spec))
+            for spec, total in total_stats.items()
+        ])
 
         self.stats_chart.update_chart(total_stats)
+        self.publish_snapshot()
+
+    def publish_snapshot(self):
+        if self.query_server:
+            self.query_server.publish(InventorySnapshot(
+                next(self.snapshot_versions),
+                self.warehouse_data,
+                self.warning_threshold,
+                self.warning_enabled
+            ))
 
 
 if __name__ == "__main__":
+    # 总部汇总：python warehouse_main.py --consolidate <变更集目录>
+    if len(sys.argv) == 3 and sys.argv[1] == "--consolidate":
+        consolidator = Consolidator()
+        consolidator.poll(DirectoryTransport(sys.argv[2]))
+        print("多站点总统计（按厚度排序）：")
+        print(format_totals(consolidator.totals()), end="")
+        sys.exit(0)
+
     try:
         app = QApplication(sys.argv)
-        app.setStyleSheet("""
-            #low_stock {
-                border-color: red;
-                border-width: 2px;
-            }
-        """)
-        window = MainWindow()
+        app.setStyleSheet(APP_STYLESHEET)
+        query_server = QueryServer()
+        try:
+            query_server.start()
+        except OSError as e:
+            print(f"查询接口启动失败: {str(e)}")
+            query_server = None
+        window = MainWindow(query_server)
+        site_id = os.environ.get("WAREHOUSE_SITE_ID")
+        replication_dir = os.environ.get("WAREHOUSE_REPLICATION_DIR")
+        if site_id and replication_dir:
+            window.enable_replication(site_id, DirectoryTransport(replication_dir))
         window.show()
         sys.exit(app.exec())
     except Exception as e: